@@ -1,11 +1,46 @@
 from flask import Flask, render_template, request, jsonify, redirect, session
+from flask import g, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from collections import OrderedDict
 from datetime import date, datetime
+from hashlib import sha1, sha256
+from calendar import monthrange
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.engine.url import URL
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+import click
+import csv
+import hmac
+import io
+import os
+import threading
+import time
 
 app = Flask(__name__)
 app.secret_key = "milk-secret-key"
 
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes", "on")
+
+# Required: a stand-in key's hashes would stop matching once it is set.
+PIN_HASH_KEY = os.environ.get("PIN_HASH_KEY")
+PIN_HASH_KEY_IS_DEV = not PIN_HASH_KEY
+if PIN_HASH_KEY_IS_DEV:
+    if not env_flag("DEV_PIN_HASH_KEY", "0"):
+        raise RuntimeError(
+            "PIN_HASH_KEY is not set (DEV_PIN_HASH_KEY=1 allows a throwaway "
+            "key for local development)"
+        )
+    app.logger.warning(
+        "PIN_HASH_KEY is not set; using a throwaway development key and "
+        "leaving legacy PINs unhashed"
+    )
+    PIN_HASH_KEY = "milk-dev-pin-hash-key"
+PIN_HASH_KEY = PIN_HASH_KEY.encode()
+
 # --------------------------------------------------
 # DATABASE CONFIG (UNCHANGED – SUPABASE via IP)
 # --------------------------------------------------
@@ -18,31 +53,114 @@ DATABASE = {
     "query": {"sslmode": "require"}
 }
 
+# Overrides the Supabase instance above (local Postgres, SQLite, bench/).
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+# --------------------------------------------------
+# CONNECTION POOL
+# --------------------------------------------------
+
+class PoolStats:
+    # QueuePool checkout wait per worker, including opening a connection.
+
+    def __init__(self):
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+pool_stats = PoolStats()
+
+class TimedQueuePool(QueuePool):
+    # Private SQLAlchemy API, hence the version pin in requirements.txt.
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_timeout()
+            raise
+        finally:
+            pool_stats.record(time.perf_counter() - t0)
+
 ENGINE_OPTIONS = {
-    "connect_args": {
+    "poolclass": TimedQueuePool,
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+    # Recycle before the pooler drops idle connections; ping on checkout.
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": env_flag("DB_POOL_PRE_PING", "1")
+}
+
+if DATABASE_URL:
+    app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+else:
+    app.config["SQLALCHEMY_DATABASE_URI"] = URL.create(**DATABASE)
+    ENGINE_OPTIONS["connect_args"] = {
         "hostaddr": "3.111.225.200",
         "port": 5432
     }
-}
 
-app.config["SQLALCHEMY_DATABASE_URI"] = URL.create(**DATABASE)
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = ENGINE_OPTIONS
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)
 
+def warm_pool():
+    # Connections inherited from a --preload master belong to the parent.
+    count = int(os.environ.get("DB_POOL_WARM", "0"))
+    with app.app_context():
+        db.engine.dispose(close=False)
+        count = min(count, db.engine.pool.size())
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(db.engine.connect())
+        except OperationalError as e:
+            app.logger.warning("Pool warm-up failed: %s", e)
+        finally:
+            for conn in conns:
+                conn.close()
+
 # --------------------------------------------------
 # MODELS
 # --------------------------------------------------
 
 class User(db.Model):
     __tablename__ = "users"
+    __table_args__ = (
+        # Serves the legacy plaintext lookup; only unhashed rows are in it.
+        db.Index(
+            "ix_users_legacy_pin",
+            "pin",
+            postgresql_where=db.text("pin_hash IS NULL"),
+            sqlite_where=db.text("pin_hash IS NULL")
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True)
-    pin = db.Column(db.String(4), nullable=False)
+    # Legacy plaintext PIN, cleared once the row has a pin_hash.
+    pin = db.Column(db.String(4))
+    pin_hash = db.Column(db.String(64), unique=True, index=True)
 
 class MilkLog(db.Model):
     __tablename__ = "milk_log"
+    __table_args__ = (
+        # Backs the month range scan and the (user_id, day) lookup.
+        db.UniqueConstraint("user_id", "day", name="uq_milk_log_user_day"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer)
     day = db.Column(db.Date)
@@ -56,6 +174,406 @@ class MonthlyPrice(db.Model):
     month = db.Column(db.Integer)
     price = db.Column(db.Integer)
 
+class MonthlySummary(db.Model):
+    # Kept current by the write endpoints; see rebuild-summaries.
+    __tablename__ = "monthly_summary"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "year", "month", name="uq_monthly_summary_user_month"
+        ),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    milk_days = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    price = db.Column(db.Integer, nullable=False, default=0)
+    total_bill = db.Column(db.Integer, nullable=False, default=0)
+
+# --------------------------------------------------
+# HELPERS
+# --------------------------------------------------
+
+def month_range(year, month):
+    # Half-open, so the (user_id, day) index can serve the predicate.
+    start = date(year, month, 1)
+    if month == 12:
+        end = date(year + 1, 1, 1)
+    else:
+        end = date(year, month + 1, 1)
+    return start, end
+
+def valid_month(year, month):
+    # month_range() needs the following month to exist as well.
+    return date.min.year <= year < date.max.year and 1 <= month <= 12
+
+def add_months(year, month, count):
+    index = year * 12 + month - 1 + count
+    return index // 12, index % 12 + 1
+
+def parse_month(value):
+    # "YYYY-MM" -> (year, month); None if missing or malformed.
+    try:
+        parsed = datetime.strptime(value or "", "%Y-%m")
+    except ValueError:
+        return None
+    return parsed.year, parsed.month
+
+def hash_pin(pin):
+    return hmac.new(PIN_HASH_KEY, pin.encode(), sha256).hexdigest()
+
+# Set to 0 once backfill-pin-hashes skips nobody (see migrations/003).
+LEGACY_PIN_FALLBACK = env_flag("LEGACY_PIN_FALLBACK", "1")
+
+def legacy_pin_users(pin):
+    # Users backfill-pin-hashes has not reached (or skipped as duplicates).
+    return User.query.filter(User.pin == pin, User.pin_hash.is_(None))
+
+def dialect_insert(model):
+    # INSERT supporting ON CONFLICT on both Postgres and SQLite.
+    if db.engine.dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
+def month_totals(user_id, year, month):
+    start, end = month_range(year, month)
+    return db.session.query(
+        db.func.count(MilkLog.id),
+        db.func.coalesce(db.func.sum(MilkLog.quantity), 0)
+    ).filter(
+        MilkLog.user_id == user_id,
+        MilkLog.day >= start,
+        MilkLog.day < end
+    ).one()
+
+SUMMARY_COLUMNS = [
+    "user_id", "year", "month", "milk_days", "total_quantity", "price",
+    "total_bill"
+]
+
+def summary_rows():
+    # The migrations/002 seed: NULL keys skipped, newest price wins.
+    year = db.cast(db.extract("year", MilkLog.day), db.Integer)
+    month = db.cast(db.extract("month", MilkLog.day), db.Integer)
+    logs = db.select(
+        MilkLog.user_id,
+        year.label("year"),
+        month.label("month"),
+        db.func.count().label("milk_days"),
+        db.func.sum(MilkLog.quantity).label("total_quantity")
+    ).where(
+        MilkLog.user_id.isnot(None), MilkLog.day.isnot(None)
+    ).group_by(MilkLog.user_id, year, month).subquery()
+
+    newest = db.select(db.func.max(MonthlyPrice.id)).where(
+        MonthlyPrice.user_id.isnot(None),
+        MonthlyPrice.year.isnot(None),
+        MonthlyPrice.month.isnot(None)
+    ).group_by(MonthlyPrice.user_id, MonthlyPrice.year, MonthlyPrice.month)
+    prices = db.select(
+        MonthlyPrice.user_id, MonthlyPrice.year, MonthlyPrice.month,
+        MonthlyPrice.price
+    ).where(MonthlyPrice.id.in_(newest)).subquery()
+
+    # FULL OUTER JOIN as the union of both key sets, for older SQLite.
+    keys = db.union(
+        db.select(logs.c.user_id, logs.c.year, logs.c.month),
+        db.select(prices.c.user_id, prices.c.year, prices.c.month)
+    ).subquery()
+
+    total_qty = db.func.coalesce(logs.c.total_quantity, 0)
+    price = db.func.coalesce(prices.c.price, 0)
+    return db.select(
+        keys.c.user_id,
+        keys.c.year,
+        keys.c.month,
+        db.func.coalesce(logs.c.milk_days, 0),
+        total_qty,
+        price,
+        total_qty * price
+    ).select_from(keys).outerjoin(logs, db.and_(
+        logs.c.user_id == keys.c.user_id,
+        logs.c.year == keys.c.year,
+        logs.c.month == keys.c.month
+    )).outerjoin(prices, db.and_(
+        prices.c.user_id == keys.c.user_id,
+        prices.c.year == keys.c.year,
+        prices.c.month == keys.c.month
+    ))
+
+def month_summary(user_id, year, month):
+    # Locked until commit, so concurrent writes to a month apply in turn.
+    query = MonthlySummary.query.filter_by(
+        user_id=user_id, year=year, month=month
+    ).with_for_update()
+    row = query.first()
+    if row:
+        return row
+
+    # A racing first write loses ON CONFLICT and locks the winner's row.
+    milk_days, total_qty = month_totals(user_id, year, month)
+    # Newest row wins when a month has several, as in rebuild-summaries.
+    price_row = MonthlyPrice.query.filter_by(
+        user_id=user_id, year=year, month=month
+    ).order_by(MonthlyPrice.id.desc()).first()
+    price = price_row.price if price_row else 0
+
+    db.session.execute(
+        dialect_insert(MonthlySummary).values(
+            user_id=user_id,
+            year=year,
+            month=month,
+            milk_days=milk_days,
+            total_quantity=total_qty,
+            price=price,
+            total_bill=total_qty * price
+        ).on_conflict_do_nothing(
+            index_elements=["user_id", "year", "month"]
+        )
+    )
+    return query.first()
+
+# --------------------------------------------------
+# MONTH CACHE
+# --------------------------------------------------
+
+class MonthCache:
+    # LRU of past months; entries expire so rebuild-summaries shows up.
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, key):
+        # put() drops the load if this month was invalidated meanwhile.
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, entry, generation):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self._generations.get(key, 0):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize
+            }
+
+month_cache = MonthCache(
+    int(os.environ.get("MONTH_CACHE_SIZE", "1024")),
+    float(os.environ.get("MONTH_CACHE_TTL", "300"))
+)
+
+# --------------------------------------------------
+# METRICS
+# --------------------------------------------------
+
+# Opt-in, and needs METRICS_TOKEN (see gunicorn.conf.py).
+METRICS_ENABLED = env_flag("METRICS_ENABLED", "0")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+if METRICS_ENABLED and not METRICS_TOKEN:
+    raise RuntimeError("METRICS_ENABLED is set but METRICS_TOKEN is not")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100, 250)
+
+class Metrics:
+
+    def __init__(self):
+        import prometheus_client as prom
+
+        self.prom = prom
+        prom.disable_created_metrics()
+        self.request_seconds = prom.Histogram(
+            "milk_request_duration_seconds", "Request latency by endpoint.",
+            ["endpoint"], buckets=LATENCY_BUCKETS
+        )
+        self.sql_statements = prom.Histogram(
+            "milk_request_sql_statements", "SQL statements executed per request.",
+            ["endpoint"], buckets=STATEMENT_BUCKETS
+        )
+        self.db_seconds = prom.Histogram(
+            "milk_request_db_seconds", "Time spent in SQL execution per request.",
+            ["endpoint"], buckets=LATENCY_BUCKETS
+        )
+        self.slow_queries = prom.Counter(
+            "milk_slow_queries", "SQL statements slower than SLOW_QUERY_MS."
+        )
+
+        # Fed by sync() from the per-process MonthCache/PoolStats totals.
+        self.counters = {
+            "cache_hits": prom.Counter(
+                "milk_month_cache_hits", "Month cache hits."),
+            "cache_misses": prom.Counter(
+                "milk_month_cache_misses", "Month cache misses."),
+            "pool_checkouts": prom.Counter(
+                "milk_db_pool_checkouts", "Connection pool checkouts."),
+            "pool_wait_seconds": prom.Counter(
+                "milk_db_pool_wait_seconds", "Time spent waiting for a pooled connection."),
+            "pool_timeouts": prom.Counter(
+                "milk_db_pool_timeouts", "Pool checkouts that timed out.")
+        }
+        self.gauges = {
+            "cache_entries": prom.Gauge(
+                "milk_month_cache_entries", "Cached months, all workers.",
+                multiprocess_mode="livesum"),
+            "pool_size": prom.Gauge(
+                "milk_db_pool_size", "Pool size, summed over workers.",
+                multiprocess_mode="livesum"),
+            "pool_max_overflow": prom.Gauge(
+                "milk_db_pool_max_overflow", "Pool max_overflow, summed over workers.",
+                multiprocess_mode="livesum"),
+            "pool_checked_out": prom.Gauge(
+                "milk_db_pool_checked_out", "Connections in use.",
+                multiprocess_mode="livesum"),
+            "pool_checked_in": prom.Gauge(
+                "milk_db_pool_checked_in", "Idle pooled connections.",
+                multiprocess_mode="livesum"),
+            "pool_overflow": prom.Gauge(
+                "milk_db_pool_overflow", "Connections open beyond pool_size.",
+                multiprocess_mode="livesum"),
+            "pool_wait_max_seconds": prom.Gauge(
+                "milk_db_pool_wait_max_seconds", "Longest pool checkout.",
+                multiprocess_mode="livemax")
+        }
+        self._synced = dict.fromkeys(self.counters, 0)
+        self._lock = threading.Lock()
+
+    def record_request(self, endpoint, seconds, statements, db_seconds):
+        self.request_seconds.labels(endpoint).observe(seconds)
+        self.sql_statements.labels(endpoint).observe(statements)
+        self.db_seconds.labels(endpoint).observe(db_seconds)
+        self.sync()
+
+    def record_slow_query(self):
+        self.slow_queries.inc()
+
+    def sync(self):
+        cache = month_cache.stats()
+        pool = db.engine.pool
+        totals = {
+            "cache_hits": cache["hits"],
+            "cache_misses": cache["misses"],
+            "pool_checkouts": pool_stats.waits,
+            "pool_wait_seconds": pool_stats.wait_total,
+            "pool_timeouts": pool_stats.timeouts
+        }
+        with self._lock:
+            for name, total in totals.items():
+                if total > self._synced[name]:
+                    self.counters[name].inc(total - self._synced[name])
+                    self._synced[name] = total
+
+        self.gauges["cache_entries"].set(cache["size"])
+        self.gauges["pool_wait_max_seconds"].set(pool_stats.wait_max)
+        self.gauges["pool_size"].set(pool.size())
+        self.gauges["pool_max_overflow"].set(ENGINE_OPTIONS["max_overflow"])
+        self.gauges["pool_checked_out"].set(pool.checkedout())
+        self.gauges["pool_checked_in"].set(pool.checkedin())
+        self.gauges["pool_overflow"].set(max(pool.overflow(), 0))
+
+    def render(self):
+        self.sync()
+        prom = self.prom
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+
+            registry = prom.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prom.REGISTRY
+        return prom.generate_latest(registry)
+
+# Kept on the execution context, so failed statements leave nothing behind.
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._milk_query_start = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._milk_query_start
+
+    if has_request_context() and "sql_count" in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        metrics.record_slow_query()
+        # Parameters are left out on purpose: they include PIN hashes.
+        app.logger.warning(
+            "Slow query (%.1f ms) in %s: %s",
+            elapsed * 1000,
+            request.endpoint if has_request_context() else "(no request)",
+            " ".join(statement.split())
+        )
+
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+def record_request(exc):
+    if "request_start" not in g:
+        return
+    metrics.record_request(
+        request.endpoint or "unmatched",
+        time.perf_counter() - g.request_start,
+        g.sql_count,
+        g.sql_time
+    )
+
+def metrics_endpoint():
+    expected = f"Bearer {METRICS_TOKEN}".encode()
+    supplied = request.headers.get("Authorization", "").encode()
+    if not hmac.compare_digest(supplied, expected):
+        return app.response_class(
+            "Unauthorized\n", status=401, mimetype="text/plain",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return app.response_class(
+        metrics.render(), content_type=metrics.prom.CONTENT_TYPE_LATEST
+    )
+
+if METRICS_ENABLED:
+    metrics = Metrics()
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", after_cursor_execute)
+    app.before_request(start_request_timer)
+    app.teardown_request(record_request)
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
+
 # --------------------------------------------------
 # AUTH
 # --------------------------------------------------
@@ -82,25 +600,51 @@ def auth():
         if not name:
             return jsonify({"error": "Name required"}), 400
 
-        if User.query.filter_by(pin=pin).first():
+        if LEGACY_PIN_FALLBACK and legacy_pin_users(pin).first():
             return jsonify({"error": "PIN already exists"}), 400
 
-        user = User(name=name, pin=pin)
+        # The unique pin_hash index settles concurrent registrations.
+        user = User(name=name, pin_hash=hash_pin(pin))
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.flush()
+            user_id = user.id
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if "pin_hash" in str(e.orig):
+                return jsonify({"error": "PIN already exists"}), 400
+            return jsonify({"error": "Name already exists"}), 400
 
-        session["user_id"] = user.id
-        session["username"] = user.name
+        session["user_id"] = user_id
+        session["username"] = name
 
         return jsonify({"success": True})
 
     # ---------- LOGIN ----------
-    user = User.query.filter_by(pin=pin).first()
-    if not user:
-        return jsonify({"error": "Invalid PIN"}), 401
+    user = User.query.filter_by(pin_hash=hash_pin(pin)).first()
+    if user:
+        user_id, username = user.id, user.name
+    else:
+        legacy = []
+        if LEGACY_PIN_FALLBACK:
+            legacy = legacy_pin_users(pin).order_by(User.id).limit(2).all()
+        if not legacy:
+            return jsonify({"error": "Invalid PIN"}), 401
+
+        user_id, username = legacy[0].id, legacy[0].name
+
+        # Not for PINs shared by legacy users, nor with the development key.
+        if len(legacy) == 1 and not PIN_HASH_KEY_IS_DEV:
+            legacy[0].pin_hash = hash_pin(pin)
+            legacy[0].pin = None
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
 
-    session["user_id"] = user.id
-    session["username"] = user.name
+    session["user_id"] = user_id
+    session["username"] = username
 
     return jsonify({"success": True})
 
@@ -136,38 +680,150 @@ def api_month():
         return jsonify({"error": "Unauthorized"}), 401
 
     user_id = session["user_id"]
-    year = int(request.args["year"])
-    month = int(request.args["month"])
+    try:
+        year = int(request.args["year"])
+        month = int(request.args["month"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "year and month must be integers"}), 400
+    if not valid_month(year, month):
+        return jsonify({"error": "Invalid year or month"}), 400
 
-    today = date.today()
-    editable = (year == today.year and month == today.month)
+    key = (year, month)
+    entry = cached_months(user_id, [key], date.today())[key]
 
-    logs = MilkLog.query.filter(
-        MilkLog.user_id == user_id,
-        db.extract("year", MilkLog.day) == year,
-        db.extract("month", MilkLog.day) == month
-    ).all()
+    response = app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
 
-    days = {log.day.strftime("%Y-%m-%d"): log.quantity for log in logs}
+def cached_months(user_id, keys, today):
+    # Past months from month_cache, the rest in one load_months() call.
+    entries = {}
+    for key in keys:
+        if key < (today.year, today.month):
+            entry = month_cache.get((user_id, *key))
+            if entry is not None:
+                entries[key] = entry
 
-    price_row = MonthlyPrice.query.filter_by(
-        user_id=user_id, year=year, month=month
-    ).first()
+    missing = [key for key in keys if key not in entries]
+    if not missing:
+        return entries
 
-    price = price_row.price if price_row else 0
-    total_qty = sum(days.values())
+    generations = {
+        key: month_cache.generation((user_id, *key)) for key in missing
+    }
+    loaded = load_months(user_id, missing[0], missing[-1], today)
+    for key in missing:
+        entries[key] = loaded[key]
+        if key < (today.year, today.month):
+            month_cache.put((user_id, *key), loaded[key], generations[key])
+    return entries
+
+def load_months(user_id, first, last, today):
+    start = month_range(*first)[0]
+    end = month_range(*last)[1]
+    logs = db.session.execute(
+        db.select(MilkLog.day, MilkLog.quantity).where(
+            MilkLog.user_id == user_id,
+            MilkLog.day >= start,
+            MilkLog.day < end
+        )
+    )
+
+    period = db.tuple_(MonthlySummary.year, MonthlySummary.month)
+    summaries = {
+        (row.year, row.month): row
+        for row in MonthlySummary.query.filter(
+            MonthlySummary.user_id == user_id,
+            period >= first,
+            period <= last
+        )
+    }
+
+    days = {}
+    key = first
+    while key <= last:
+        days[key] = []
+        key = add_months(*key, 1)
+    for day, quantity in logs:
+        days[(day.year, day.month)].append((day, quantity))
+
+    return {
+        (y, m): month_entry(
+            y, m, month_days, summaries.get((y, m)),
+            editable=(y == today.year and m == today.month)
+        )
+        for (y, m), month_days in days.items()
+    }
+
+def month_entry(year, month, logs, summary, editable):
+    # "month" is the compact /api/months form: days[i] is day i + 1.
+    summary = {
+        "milk_days": summary.milk_days if summary else 0,
+        "total_quantity": summary.total_quantity if summary else 0,
+        "price": summary.price if summary else 0,
+        "total_bill": summary.total_bill if summary else 0
+    }
 
-    return jsonify({
+    body = app.json.dumps({
         "editable": editable,
-        "days": days,
-        "summary": {
-            "milk_days": len(days),
-            "total_quantity": total_qty,
-            "price": price,
-            "total_bill": total_qty * price
-        }
+        "days": {day.strftime("%Y-%m-%d"): quantity for day, quantity in logs},
+        "summary": summary
     })
 
+    quantities = [0] * monthrange(year, month)[1]
+    for day, quantity in logs:
+        quantities[day.day - 1] = quantity
+
+    return {
+        "body": body,
+        "etag": sha1(body.encode()).hexdigest(),
+        "month": {
+            "year": year,
+            "month": month,
+            "editable": editable,
+            "days": quantities,
+            "summary": summary
+        }
+    }
+
+# --------------------------------------------------
+# API: MONTHS (PREFETCH WINDOW)
+# --------------------------------------------------
+
+MAX_MONTH_SPAN = 12
+
+@app.route("/api/months")
+def api_months():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_id = session["user_id"]
+    try:
+        year = int(request.args["year"])
+        month = int(request.args["month"])
+        span = int(request.args.get("span", 6))
+    except (KeyError, ValueError):
+        return jsonify({"error": "year, month and span must be integers"}), 400
+    if not valid_month(year, month):
+        return jsonify({"error": "Invalid year or month"}), 400
+    if not 0 <= span <= MAX_MONTH_SPAN:
+        return jsonify({"error": f"span must be 0-{MAX_MONTH_SPAN}"}), 400
+
+    first = add_months(year, month, -span)
+    last = add_months(year, month, span)
+    if not valid_month(*first) or not valid_month(*last):
+        return jsonify({"error": "Window is out of range"}), 400
+
+    keys = [add_months(*first, offset) for offset in range(2 * span + 1)]
+    entries = cached_months(user_id, keys, date.today())
+    months = [entries[key]["month"] for key in keys]
+
+    response = jsonify({"months": months})
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
 # --------------------------------------------------
 # API: DAY
 # --------------------------------------------------
@@ -182,12 +838,16 @@ def api_day():
 
     day = datetime.strptime(data["date"], "%Y-%m-%d").date()
     qty = int(data["quantity"])
+    if qty < 0:
+        return jsonify({"error": "Quantity must be 0 or more"}), 400
 
     today = date.today()
     if day.year != today.year or day.month != today.month:
         return jsonify({"error": "Read only"}), 403
 
+    summary = month_summary(user_id, day.year, day.month)
     log = MilkLog.query.filter_by(user_id=user_id, day=day).first()
+    old_qty = log.quantity if log else 0
 
     if qty == 0:
         if log:
@@ -198,9 +858,88 @@ def api_day():
         else:
             db.session.add(MilkLog(user_id=user_id, day=day, quantity=qty))
 
+    summary.milk_days += (qty > 0) - (old_qty > 0)
+    summary.total_quantity += qty - old_qty
+    summary.total_bill = summary.total_quantity * summary.price
+
     db.session.commit()
+    month_cache.invalidate((user_id, day.year, day.month))
     return jsonify({"success": True})
 
+# --------------------------------------------------
+# API: DAYS (BULK)
+# --------------------------------------------------
+
+@app.route("/api/days", methods=["POST"])
+def api_days():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_id = session["user_id"]
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "Expected a non-empty list of entries"}), 400
+
+    # ON CONFLICT cannot touch a row twice, so the last entry per date wins.
+    quantities = {}
+    for entry in entries:
+        try:
+            day = datetime.strptime(entry["date"], "%Y-%m-%d").date()
+            qty = entry["quantity"]
+        except (TypeError, KeyError, ValueError):
+            qty = None
+        if not isinstance(qty, int) or isinstance(qty, bool):
+            return jsonify({
+                "error": "Each entry needs a YYYY-MM-DD date and an integer quantity"
+            }), 400
+        if qty < 0:
+            return jsonify({"error": "Quantity must be 0 or more"}), 400
+        quantities[day] = qty
+
+    today = date.today()
+    for day in quantities:
+        if day.year != today.year or day.month != today.month:
+            return jsonify({"error": "Read only"}), 403
+
+    summary = month_summary(user_id, today.year, today.month)
+
+    upserts = [
+        {"user_id": user_id, "day": day, "quantity": qty}
+        for day, qty in quantities.items() if qty != 0
+    ]
+    deletes = [day for day, qty in quantities.items() if qty == 0]
+
+    if upserts:
+        stmt = dialect_insert(MilkLog).values(upserts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MilkLog.user_id, MilkLog.day],
+            set_={"quantity": stmt.excluded.quantity}
+        )
+        db.session.execute(stmt)
+
+    if deletes:
+        db.session.execute(
+            db.delete(MilkLog).where(
+                MilkLog.user_id == user_id,
+                MilkLog.day.in_(deletes)
+            )
+        )
+
+    milk_days, total_qty = month_totals(user_id, today.year, today.month)
+    summary.milk_days = milk_days
+    summary.total_quantity = total_qty
+    summary.total_bill = total_qty * summary.price
+
+    db.session.commit()
+    month_cache.invalidate((user_id, today.year, today.month))
+
+    key = (today.year, today.month)
+    entry = load_months(user_id, key, key, today)[key]
+
+    response = app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    return response
+
 # --------------------------------------------------
 # API: PRICE
 # --------------------------------------------------
@@ -216,7 +955,7 @@ def api_price():
 
     row = MonthlyPrice.query.filter_by(
         user_id=user_id, year=today.year, month=today.month
-    ).first()
+    ).order_by(MonthlyPrice.id.desc()).first()
 
     if row:
         row.price = price
@@ -228,9 +967,193 @@ def api_price():
             price=price
         ))
 
+    summary = month_summary(user_id, today.year, today.month)
+    summary.price = price
+    summary.total_bill = summary.total_quantity * price
+
     db.session.commit()
+    month_cache.invalidate((user_id, today.year, today.month))
     return jsonify({"success": True})
 
+# --------------------------------------------------
+# API: REPORT
+# --------------------------------------------------
+
+MAX_REPORT_MONTHS = 120
+
+@app.route("/api/report")
+def api_report():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_id = session["user_id"]
+    first = parse_month(request.args.get("from"))
+    last = parse_month(request.args.get("to"))
+    if not first or not last or first > last:
+        return jsonify({"error": "from/to must be YYYY-MM with from <= to"}), 400
+    if not valid_month(*first) or not valid_month(*last):
+        return jsonify({"error": "Invalid year or month"}), 400
+    if add_months(*first, MAX_REPORT_MONTHS) <= last:
+        return jsonify({
+            "error": f"from/to may span at most {MAX_REPORT_MONTHS} months"
+        }), 400
+
+    # One scan of monthly_summary covers the whole range.
+    period = db.tuple_(MonthlySummary.year, MonthlySummary.month)
+    rows = MonthlySummary.query.filter(
+        MonthlySummary.user_id == user_id,
+        period >= first,
+        period <= last
+    ).all()
+    by_month = {(row.year, row.month): row for row in rows}
+
+    months = []
+    totals = {"milk_days": 0, "total_quantity": 0, "total_bill": 0}
+    year, month = first
+    while (year, month) <= last:
+        row = by_month.get((year, month))
+        item = {
+            "year": year,
+            "month": month,
+            "milk_days": row.milk_days if row else 0,
+            "total_quantity": row.total_quantity if row else 0,
+            "price": row.price if row else 0,
+            "total_bill": row.total_bill if row else 0
+        }
+        months.append(item)
+        for field in totals:
+            totals[field] += item[field]
+
+        year, month = add_months(year, month, 1)
+
+    return jsonify({"months": months, "total": totals})
+
+@app.route("/api/export.csv")
+def api_export():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_id = session["user_id"]
+    first = parse_month(request.args.get("from"))
+    last = parse_month(request.args.get("to"))
+    if not first or not last or first > last:
+        return jsonify({"error": "from/to must be YYYY-MM with from <= to"}), 400
+    if not valid_month(*first) or not valid_month(*last):
+        return jsonify({"error": "Invalid year or month"}), 400
+
+    start = month_range(*first)[0]
+    end = month_range(*last)[1]
+
+    # yield_per streams through a server-side cursor on Postgres.
+    stmt = db.select(MilkLog.day, MilkLog.quantity).where(
+        MilkLog.user_id == user_id,
+        MilkLog.day >= start,
+        MilkLog.day < end
+    ).order_by(MilkLog.day).execution_options(yield_per=1000)
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["date", "quantity"])
+
+        for partition in db.session.execute(stmt).partitions():
+            writer.writerows(
+                (day.isoformat(), quantity) for day, quantity in partition
+            )
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+        yield buf.getvalue()
+
+    filename = "milk-%04d-%02d-to-%04d-%02d.csv" % (first + last)
+    return app.response_class(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+
+@app.cli.command("init-db")
+def init_db():
+    """Create all tables on a fresh database (see DATABASE_URL)."""
+    db.create_all()
+    print(f"Created tables on {db.engine.url.render_as_string()}")
+
+@app.cli.command("rebuild-summaries")
+def rebuild_summaries():
+    """Recompute monthly_summary from milk_log and monthly_price."""
+    # Holds off writers until commit; SQLite has no LOCK TABLE, run offline.
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(db.text("LOCK TABLE monthly_summary IN EXCLUSIVE MODE"))
+
+    MonthlySummary.query.delete()
+    result = db.session.execute(
+        db.insert(MonthlySummary).from_select(SUMMARY_COLUMNS, summary_rows())
+    )
+    db.session.commit()
+
+    print(f"Rebuilt {result.rowcount} monthly summaries")
+
+@app.cli.command("backfill-pin-hashes")
+def backfill_pin_hashes():
+    """Fill users.pin_hash from the legacy plaintext pin column."""
+    if PIN_HASH_KEY_IS_DEV:
+        raise click.ClickException(
+            "PIN_HASH_KEY is not set; refusing to hash PINs with the "
+            "development key and clear their plaintext"
+        )
+
+    pending = db.session.query(User.id, User.name, User.pin).filter(
+        User.pin_hash.is_(None), User.pin.isnot(None)
+    ).order_by(User.id).all()
+
+    # Shared or already-taken PINs stay on the plaintext fallback.
+    counts = {}
+    for _, _, pin in pending:
+        counts[pin] = counts.get(pin, 0) + 1
+    taken = {
+        pin_hash for pin_hash, in
+        db.session.query(User.pin_hash).filter(User.pin_hash.isnot(None))
+    }
+
+    updates = []
+    skipped = []
+    for user_id, name, pin in pending:
+        pin_hash = hash_pin(pin)
+        if counts[pin] > 1 or pin_hash in taken:
+            skipped.append((user_id, name))
+        else:
+            updates.append({"id": user_id, "pin_hash": pin_hash, "pin": None})
+
+    hashed = 0
+    for i in range(0, len(updates), 500):
+        batch = updates[i:i + 500]
+        try:
+            db.session.execute(db.update(User), batch)
+            db.session.commit()
+            hashed += len(batch)
+        except IntegrityError:
+            # A concurrent registration took one of these PINs; go row by row.
+            db.session.rollback()
+            for row in batch:
+                try:
+                    db.session.execute(db.update(User), [row])
+                    db.session.commit()
+                    hashed += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    skipped.append((row["id"], None))
+
+    print(f"Hashed {hashed} PINs")
+    if skipped:
+        print(f"Skipped {len(skipped)} users with a duplicate PIN:")
+        for user_id, name in skipped:
+            print(f"  id={user_id} name={name}")
+
 # --------------------------------------------------
 # START
 # --------------------------------------------------
@@ -0,0 +1,282 @@
+"""
+Load-test the Flask endpoints against a local database stand-in.
+
+Seeds --users users x --months months of milk_log/monthly_price into
+--url (or BENCH_DATABASE_URL), then runs --clients concurrent clients, each logged in as its
+own user, through a weighted mix of /auth, /api/month, /api/day, /api/days
+and /api/price for --duration seconds. Requests go through the WSGI app
+in-process (Flask test client), so the numbers cover app + database without
+HTTP server overhead.
+
+    python bench/load.py
+    python bench/load.py --url postgresql+psycopg2://localhost/milk_bench \\
+        --users 1000 --months 24 --clients 16 --json bench_output.json
+
+Reports throughput and p50/p95/p99 latency per endpoint; --json also writes
+them with the commit and settings so runs can be diffed across commits.
+Set MONTH_CACHE_SIZE=0 to measure /api/month without the month cache.
+
+The app's own DATABASE_URL is ignored: the benchmark points the app at
+--url instead (see safety.py).
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy.engine.url import make_url
+from safety import add_arguments, check_target
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_URL = os.environ.get(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "milk_bench.db"),
+)
+
+# Bound by load_app() once the target database has been checked; app.py
+# picks its database from DATABASE_URL at import time.
+MilkLog = MonthlyPrice = User = app = db = hash_pin = None
+
+
+def load_app(url):
+    global MilkLog, MonthlyPrice, User, app, db, hash_pin
+    os.environ["DATABASE_URL"] = url
+    # app.py refuses to start without one; the seeded users are disposable.
+    os.environ.setdefault("PIN_HASH_KEY", "bench-pin-hash-key")
+    from app import MilkLog, MonthlyPrice, User, app, db, hash_pin
+
+# Relative frequency of each operation in the client mix.
+MIX = {
+    "auth": 5,
+    "api_month": 60,
+    "api_day": 20,
+    "api_days": 5,
+    "api_price": 10,
+}
+
+
+def seed(users, months, rng):
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(db.insert(User), [
+        {"name": f"user{i}", "pin_hash": hash_pin(f"{i:04d}")}
+        for i in range(users)
+    ])
+
+    today = date.today()
+    first = today.replace(day=1)
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+
+    user_ids = [row.id for row in User.query.with_entities(User.id)]
+    logs = []
+    prices = []
+    for user_id in user_ids:
+        day = first
+        while day <= today:
+            if day.day == 1:
+                prices.append({
+                    "user_id": user_id,
+                    "year": day.year,
+                    "month": day.month,
+                    "price": rng.randint(40, 70),
+                })
+            if rng.random() < 0.8:
+                logs.append({
+                    "user_id": user_id,
+                    "day": day,
+                    "quantity": rng.choice((1, 2)),
+                })
+            day += timedelta(days=1)
+        if len(logs) >= 10000:
+            db.session.execute(db.insert(MilkLog), logs)
+            logs = []
+
+    if logs:
+        db.session.execute(db.insert(MilkLog), logs)
+    db.session.execute(db.insert(MonthlyPrice), prices)
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-summaries"])
+    if result.exit_code != 0:
+        sys.exit(f"rebuild-summaries failed: {result.exception or result.output}")
+    return len(user_ids)
+
+
+class Client:
+    def __init__(self, index, months, rng):
+        self.http = app.test_client()
+        self.pin = f"{index:04d}"
+        self.months = months
+        self.rng = rng
+        self.today = date.today()
+
+    def auth(self):
+        return self.http.post("/auth", json={"mode": "login", "pin": self.pin})
+
+    def api_month(self):
+        # Mostly the current month, otherwise a random past one.
+        back = 0 if self.rng.random() < 0.5 else self.rng.randrange(self.months)
+        month = self.today.month - back - 1
+        year = self.today.year + month // 12
+        month = month % 12 + 1
+        return self.http.get(f"/api/month?year={year}&month={month}")
+
+    def _day(self):
+        return self.today.replace(day=self.rng.randint(1, self.today.day))
+
+    def api_day(self):
+        return self.http.post("/api/day", json={
+            "date": self._day().isoformat(),
+            "quantity": self.rng.choice((0, 1, 2)),
+        })
+
+    def api_days(self):
+        return self.http.post("/api/days", json=[
+            {"date": self._day().isoformat(), "quantity": self.rng.choice((0, 1, 2))}
+            for _ in range(7)
+        ])
+
+    def api_price(self):
+        return self.http.post("/api/price", json={"price": self.rng.randint(40, 70)})
+
+
+def run_client(client, deadline, samples, errors, lock):
+    ops = list(MIX)
+    weights = [MIX[op] for op in ops]
+    local = {op: [] for op in ops}
+    failed = {op: 0 for op in ops}
+
+    while time.perf_counter() < deadline:
+        op = client.rng.choices(ops, weights)[0]
+        t0 = time.perf_counter()
+        response = getattr(client, op)()
+        elapsed = time.perf_counter() - t0
+        if response.status_code >= 400:
+            failed[op] += 1
+        else:
+            local[op].append(elapsed)
+
+    with lock:
+        for op in ops:
+            samples[op].extend(local[op])
+            errors[op] += failed[op]
+
+
+def percentile(sorted_samples, pct):
+    index = max(0, round(pct / 100 * len(sorted_samples)) - 1)
+    return sorted_samples[index]
+
+
+def summarize(samples, errors, wall):
+    results = {}
+    for op, values in samples.items():
+        values.sort()
+        row = {"count": len(values), "errors": errors[op], "rps": len(values) / wall}
+        if values:
+            row.update({
+                "mean_ms": statistics.fmean(values) * 1000,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            })
+        results[op] = row
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", metavar="PATH")
+    add_arguments(parser, DEFAULT_URL)
+    args = parser.parse_args()
+
+    if not 0 < args.clients <= args.users <= 10000:
+        parser.error("need 0 < clients <= users <= 10000 (4-digit PINs)")
+
+    check_target(args.url, args.force)
+    load_app(args.url)
+
+    with app.app_context():
+        t0 = time.perf_counter()
+        seed(args.users, args.months, random.Random(args.seed))
+        print(f"seeded {args.users} users x {args.months} months "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+    clients = [
+        Client(i, args.months, random.Random(args.seed + i))
+        for i in range(args.clients)
+    ]
+    for client in clients:
+        client.auth()
+
+    samples = {op: [] for op in MIX}
+    errors = {op: 0 for op in MIX}
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=run_client, args=(c, deadline, samples, errors, lock))
+        for c in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    results = summarize(samples, errors, wall)
+
+    print(f"{'endpoint':<10} {'count':>7} {'err':>5} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for op, row in results.items():
+        print(f"{op:<10} {row['count']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+              f"{row.get('p50_ms', 0):>8.2f} {row.get('p95_ms', 0):>8.2f} "
+              f"{row.get('p99_ms', 0):>8.2f}")
+
+    if args.json:
+        report = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "database": args.url.split(":", 1)[0],
+            "settings": {
+                **vars(args),
+                "url": make_url(args.url).render_as_string(),
+            },
+            "wall_s": wall,
+            "endpoints": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
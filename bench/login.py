@@ -0,0 +1,183 @@
+"""
+Micro-benchmark for the /auth PIN lookup.
+
+Seeds a users table twice -- once with the old plaintext, unindexed pin
+column, once with the current model -- then prints the query plans and
+latency of a login lookup against each. The new lookup follows /auth:
+the HMAC of the PIN, the pin_hash index probe and, on a miss, the legacy
+plaintext fallback (pin = ? AND pin_hash IS NULL) unless it is switched
+off with LEGACY_PIN_FALLBACK=0. About half of the lookups are misses.
+
+    python bench/login.py
+    python bench/login.py --url postgresql+psycopg2://localhost/milk_bench
+
+A 4-digit PIN must be unique, so every table holds PIN_SPACE / 2 real
+users, padded to --users with rows no PIN matches. All runs see the same
+rows in the same order and look up the same PINs.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import sqlalchemy as sa
+from safety import add_arguments, check_target, explain
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("PIN_HASH_KEY", "bench-pin-hash-key")
+from app import User, hash_pin  # noqa: E402
+
+PIN_SPACE = 10000
+PADDING_PIN = "----"
+
+
+def old_table(metadata):
+    # users as it was created before migrations/003.
+    return sa.Table(
+        "users",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, unique=True),
+        sa.Column("pin", sa.String(4), nullable=False),
+    )
+
+
+def seed(engine, table, rows, legacy):
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+
+    hashed = "pin_hash" in table.c
+    pins = random.Random(42).sample(range(PIN_SPACE), PIN_SPACE // 2)
+    # None marks a padding row; its pin/pin_hash matches no 4-digit PIN.
+    slots = list(range(len(pins))) + [None] * max(0, rows - len(pins))
+    random.Random(43).shuffle(slots)
+
+    batch = []
+    with engine.begin() as conn:
+        for i, slot in enumerate(slots):
+            if slot is None:
+                pin, pin_hash = PADDING_PIN, hash_pin(f"padding{i}")
+            else:
+                pin = f"{pins[slot]:04d}"
+                pin_hash = hash_pin(pin)
+            row = {"name": f"user{i}"}
+            if not hashed:
+                row["pin"] = pin
+            elif slot is not None and slot < legacy:
+                row["pin"], row["pin_hash"] = pin, None
+            else:
+                row["pin"], row["pin_hash"] = None, pin_hash
+            batch.append(row)
+            if len(batch) >= 10000:
+                conn.execute(table.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(sa.text("ANALYZE users"))
+    return len(slots)
+
+
+def old_login(conn, table, pin):
+    stmt = sa.select(table).where(table.c.pin == pin).limit(1)
+    return conn.execute(stmt).first()
+
+
+def new_statements(table, pin):
+    probe = sa.select(table).where(table.c.pin_hash == hash_pin(pin)).limit(1)
+    fallback = sa.select(table).where(
+        table.c.pin == pin, table.c.pin_hash.is_(None)
+    ).order_by(table.c.id).limit(2)
+    return probe, fallback
+
+
+def new_login(fallback_enabled):
+    # Same statements, in the same order, as the login branch of auth().
+    def login(conn, table, pin):
+        probe, fallback = new_statements(table, pin)
+        user = conn.execute(probe).first()
+        if user is None and fallback_enabled:
+            user = conn.execute(fallback).first()
+        return user
+    return login
+
+
+def stats(samples):
+    if not samples:
+        return "n=0"
+    samples.sort()
+    return "n={} p50={:.3f} p95={:.3f} mean={:.3f}".format(
+        len(samples),
+        statistics.median(samples),
+        samples[max(0, int(len(samples) * 0.95) - 1)],
+        statistics.fmean(samples),
+    )
+
+
+def timed(conn, login, table, repeat):
+    rng = random.Random(7)
+    hits, misses = [], []
+    for _ in range(repeat):
+        pin = f"{rng.randrange(PIN_SPACE):04d}"
+        t0 = time.perf_counter()
+        user = login(conn, table, pin)
+        elapsed = (time.perf_counter() - t0) * 1000
+        (hits if user else misses).append(elapsed)
+    return hits, misses
+
+
+def run(label, engine, table, login, plans, rows, legacy, repeat):
+    rows = seed(engine, table, rows, legacy)
+    with engine.connect() as conn:
+        plan_lines = [line for stmt in plans(table) for line in explain(conn, stmt)]
+        hits, misses = timed(conn, login, table, repeat)
+
+    print(f"== {label} ({rows} users)")
+    for line in plan_lines:
+        print("   ", line)
+    print("    latency ms, all:    ", stats(hits + misses))
+    print("    latency ms, hits:   ", stats(hits))
+    print("    latency ms, misses: ", stats(misses))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser, "sqlite://")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--legacy", type=int, default=0,
+                        help="real users not backfilled yet (at most PIN_SPACE / 2)")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+    check_target(args.url, args.force)
+
+    engine = sa.create_engine(args.url)
+    sample_pin = f"{PIN_SPACE - 1:04d}"
+
+    run("before: plaintext pin, no index",
+        engine, old_table(sa.MetaData()),
+        old_login,
+        lambda t: [sa.select(t).where(t.c.pin == sample_pin).limit(1)],
+        args.users, 0, args.repeat)
+    run("after: HMAC pin_hash probe + legacy fallback (/auth default)",
+        engine, User.__table__,
+        new_login(True),
+        lambda t: new_statements(t, sample_pin),
+        args.users, args.legacy, args.repeat)
+    run("after: LEGACY_PIN_FALLBACK=0",
+        engine, User.__table__,
+        new_login(False),
+        lambda t: new_statements(t, sample_pin)[:1],
+        args.users, args.legacy, args.repeat)
+
+    User.__table__.drop(engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    main()
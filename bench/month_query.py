@@ -0,0 +1,147 @@
+"""
+Micro-benchmark for the /api/month milk_log query.
+
+Seeds a large milk_log table twice -- once with the old unindexed schema,
+once with the current model (unique (user_id, day)) -- then prints the
+query plan and latency of the old extract() predicate against the new
+half-open date range.
+
+    python bench/month_query.py
+    python bench/month_query.py --url postgresql+psycopg2://localhost/milk_bench --users 2000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import sqlalchemy as sa
+from safety import add_arguments, check_target, explain
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("PIN_HASH_KEY", "bench-pin-hash-key")
+from app import MilkLog, month_range  # noqa: E402
+
+
+def old_table(metadata):
+    # milk_log as it was created before migrations/001.
+    return sa.Table(
+        "milk_log",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer),
+        sa.Column("day", sa.Date),
+        sa.Column("quantity", sa.Integer),
+    )
+
+
+def seed(engine, table, users, months):
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+
+    first = date.today().replace(day=1)
+    for _ in range(months):
+        first = (first - timedelta(days=1)).replace(day=1)
+    last = date.today()
+
+    rng = random.Random(42)
+    batch = []
+    with engine.begin() as conn:
+        for user_id in range(1, users + 1):
+            day = first
+            while day <= last:
+                if rng.random() < 0.8:
+                    batch.append({
+                        "user_id": user_id,
+                        "day": day,
+                        "quantity": rng.choice((1, 2)),
+                    })
+                day += timedelta(days=1)
+            if len(batch) >= 10000:
+                conn.execute(table.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+        rows = conn.execute(sa.select(sa.func.count()).select_from(table)).scalar()
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(sa.text("ANALYZE milk_log"))
+    return rows
+
+
+def old_query(table, user_id, year, month):
+    return sa.select(table.c.day, table.c.quantity).where(
+        table.c.user_id == user_id,
+        sa.extract("year", table.c.day) == year,
+        sa.extract("month", table.c.day) == month,
+    )
+
+
+def new_query(table, user_id, year, month):
+    start, end = month_range(year, month)
+    return sa.select(table.c.day, table.c.quantity).where(
+        table.c.user_id == user_id,
+        table.c.day >= start,
+        table.c.day < end,
+    )
+
+
+def timed(conn, make_stmt, table, users, repeat):
+    today = date.today()
+    rng = random.Random(7)
+    samples = []
+    for _ in range(repeat):
+        stmt = make_stmt(table, rng.randint(1, users), today.year, today.month)
+        t0 = time.perf_counter()
+        conn.execute(stmt).all()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples),
+    }
+
+
+def run(label, engine, table, make_stmt, args):
+    rows = seed(engine, table, args.users, args.months)
+    today = date.today()
+    with engine.connect() as conn:
+        plan = explain(conn, make_stmt(table, 1, today.year, today.month))
+        stats = timed(conn, make_stmt, table, args.users, args.repeat)
+
+    print(f"== {label} ({rows} rows)")
+    for line in plan:
+        print("   ", line)
+    print(
+        "    latency ms: p50={p50:.3f} p95={p95:.3f} mean={mean:.3f}".format(**stats)
+    )
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser, "sqlite://")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    check_target(args.url, args.force)
+
+    engine = sa.create_engine(args.url)
+
+    run("before: extract(year/month), no index",
+        engine, old_table(sa.MetaData()), old_query, args)
+    run("after: day range, unique (user_id, day)",
+        engine, MilkLog.__table__, new_query, args)
+
+    MilkLog.__table__.drop(engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    main()
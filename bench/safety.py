@@ -0,0 +1,41 @@
+"""
+Helpers shared by the benchmarks.
+
+Every benchmark drops and recreates the tables it seeds in --url, so only
+SQLite and localhost URLs are accepted without --i-know-this-drops-tables.
+"""
+
+import sys
+
+import sqlalchemy as sa
+from sqlalchemy.engine.url import make_url
+
+LOCAL_HOSTS = {None, "", "localhost", "127.0.0.1", "::1"}
+
+
+def check_target(url, force=False):
+    # SQLite files and Postgres on this machine only, unless --i-know-this-drops-tables.
+    parsed = make_url(url)
+    if force or parsed.get_backend_name() == "sqlite" or parsed.host in LOCAL_HOSTS:
+        return
+    sys.exit(
+        f"refusing to drop tables on {parsed.render_as_string()}: not SQLite "
+        "or localhost (pass --i-know-this-drops-tables to override)"
+    )
+
+
+def add_arguments(parser, default_url):
+    parser.add_argument("--url", default=default_url,
+                        help="disposable database to seed (default: %(default)s)")
+    parser.add_argument("--i-know-this-drops-tables", dest="force",
+                        action="store_true",
+                        help="allow a non-local, non-SQLite --url")
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(conn, compile_kwargs={"literal_binds": True})
+    if conn.dialect.name == "sqlite":
+        sql = "EXPLAIN QUERY PLAN " + str(compiled)
+        return [row[-1] for row in conn.execute(sa.text(sql))]
+    sql = "EXPLAIN ANALYZE " + str(compiled)
+    return [row[0] for row in conn.execute(sa.text(sql))]
@@ -0,0 +1,43 @@
+# Loaded automatically by `gunicorn app:app` from the project root.
+#
+# Pool sizing is read by app.py from DB_POOL_SIZE, DB_MAX_OVERFLOW,
+# DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_PRE_PING. Keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the database's
+# connection limit. Set DB_POOL_WARM=N to open N connections per worker
+# at startup, before the first request; with --preload, post_fork first
+# drops the connections a worker inherited from the master.
+#
+# PIN_HASH_KEY must be set (see migrations/003_users_pin_hash.sql).
+#
+# Metrics are opt-in: without METRICS_ENABLED=1 no hooks are installed,
+# /metrics does not exist and prometheus_client is not imported. With it,
+# set METRICS_TOKEN and scrape with "Authorization: Bearer $METRICS_TOKEN".
+# Also set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory (tmpfs
+# is best) so /metrics adds up all workers, whichever one answers; without
+# it the numbers are those of the answering worker only. The directory is
+# cleared here on startup.
+
+import glob
+import os
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server):
+    if MULTIPROC_DIR:
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    from app import warm_pool
+
+    warm_pool()
+
+
+def child_exit(server, worker):
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,24 @@
+-- milk_log: unique (user_id, day)
+--
+-- Existing deployments were created without any index on milk_log, so the
+-- monthly calendar query scanned the whole table. The unique constraint is
+-- backed by a composite btree on (user_id, day), which serves both the
+-- per-month range scan in /api/month and the single-day lookup in /api/day.
+--
+-- Run once:  psql "$DATABASE_URL" -f migrations/001_milk_log_user_day.sql
+
+BEGIN;
+
+-- Keep the newest row when the same day was logged more than once.
+DELETE FROM milk_log a
+USING milk_log b
+WHERE a.user_id = b.user_id
+  AND a.day = b.day
+  AND a.id < b.id;
+
+ALTER TABLE milk_log
+    ADD CONSTRAINT uq_milk_log_user_day UNIQUE (user_id, day);
+
+COMMIT;
+
+ANALYZE milk_log;
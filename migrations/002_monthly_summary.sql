@@ -0,0 +1,63 @@
+-- monthly_summary: per-user month totals
+--
+-- One row per (user_id, year, month), kept up to date by /api/day,
+-- /api/days and /api/price so /api/month reads its summary from a single
+-- indexed row. The table is seeded from milk_log and monthly_price in the
+-- same transaction, so past months never read as empty.
+--
+-- Run once, in the same deploy as the app change:
+--            psql "$DATABASE_URL" -f migrations/002_monthly_summary.sql
+-- Writes the old app makes after this runs are not counted; if the two
+-- steps are far apart, re-run  flask --app app rebuild-summaries.
+-- Running workers serve the rebuilt past months once their cached copies
+-- expire, after MONTH_CACHE_TTL seconds (default 300).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS monthly_summary (
+    id             SERIAL PRIMARY KEY,
+    user_id        INTEGER NOT NULL,
+    year           INTEGER NOT NULL,
+    month          INTEGER NOT NULL,
+    milk_days      INTEGER NOT NULL DEFAULT 0,
+    total_quantity INTEGER NOT NULL DEFAULT 0,
+    price          INTEGER NOT NULL DEFAULT 0,
+    total_bill     INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_monthly_summary_user_month UNIQUE (user_id, year, month)
+);
+
+-- Hold off writers until the seed is committed.
+LOCK TABLE milk_log, monthly_price IN SHARE MODE;
+
+-- Keep in step with summary_rows() in app.py, which rebuild-summaries runs.
+WITH logs AS (
+    SELECT user_id,
+           EXTRACT(YEAR FROM day)::int AS year,
+           EXTRACT(MONTH FROM day)::int AS month,
+           COUNT(*) AS milk_days,
+           SUM(quantity) AS total_quantity
+    FROM milk_log
+    WHERE user_id IS NOT NULL AND day IS NOT NULL
+    GROUP BY 1, 2, 3
+),
+prices AS (
+    -- Newest row wins when a month has several, as in rebuild-summaries.
+    SELECT DISTINCT ON (user_id, year, month) user_id, year, month, price
+    FROM monthly_price
+    WHERE user_id IS NOT NULL AND year IS NOT NULL AND month IS NOT NULL
+    ORDER BY user_id, year, month, id DESC
+)
+INSERT INTO monthly_summary
+    (user_id, year, month, milk_days, total_quantity, price, total_bill)
+SELECT user_id,
+       year,
+       month,
+       COALESCE(logs.milk_days, 0),
+       COALESCE(logs.total_quantity, 0),
+       COALESCE(prices.price, 0),
+       COALESCE(logs.total_quantity, 0) * COALESCE(prices.price, 0)
+FROM logs
+FULL OUTER JOIN prices USING (user_id, year, month)
+ON CONFLICT (user_id, year, month) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- users: keyed PIN hash with a unique index
+--
+-- Login and register look users up by HMAC-SHA256(PIN_HASH_KEY, pin)
+-- through ix_users_pin_hash instead of scanning the plaintext pin column.
+--
+-- Run once:  psql "$DATABASE_URL" -f migrations/003_users_pin_hash.sql
+-- then, with the production PIN_HASH_KEY set:
+--            flask --app app backfill-pin-hashes
+-- Until then, login falls back to the plaintext pin for rows without a
+-- pin_hash (through the small partial index ix_users_legacy_pin) and
+-- upgrades them; a row's plaintext pin is cleared once it is hashed. The
+-- backfill skips and lists users sharing a PIN; give them new PINs and
+-- re-run it. Once it skips nobody, set LEGACY_PIN_FALLBACK=0. Keep the
+-- emptied pin column: the User model still maps it.
+--
+-- The app refuses to start without PIN_HASH_KEY. DEV_PIN_HASH_KEY=1 runs it
+-- with a throwaway key for local development, which never hashes or
+-- clears a legacy row.
+
+BEGIN;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS pin_hash VARCHAR(64);
+ALTER TABLE users ALTER COLUMN pin DROP NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_pin_hash ON users (pin_hash);
+CREATE INDEX IF NOT EXISTS ix_users_legacy_pin ON users (pin)
+    WHERE pin_hash IS NULL;
+
+COMMIT;